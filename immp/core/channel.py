@@ -216,7 +216,21 @@ class Group(Configurable):
                                      if item not in config[field])
         return cls(None, config, host)
 
-    async def has_channel(self, channel):
+    async def has_channel(self, channel, private=None):
+        """
+        Test if a channel is a member of this group.
+
+        Args:
+            channel (.Channel):
+                Channel to look for.
+            private (bool):
+                Result of :meth:`.Channel.is_private` if already known, otherwise it will be looked
+                up if needed to match private or shared plug rules.
+
+        Returns:
+            bool:
+                ``True`` if the channel is included in this group.
+        """
         if not isinstance(channel, Channel):
             raise TypeError
         elif channel in self._exclude:
@@ -227,7 +241,11 @@ class Group(Configurable):
             return True
         elif self.has_plug(channel.plug, "named") and channel in self.host.channels.values():
             return True
-        private = await channel.is_private()
+        elif not self.has_plug(channel.plug, "private", "shared"):
+            # Avoid querying the plug for channel privacy if the result isn't used.
+            return False
+        if private is None:
+            private = await channel.is_private()
         if self.has_plug(channel.plug, "private") and private:
             return True
         elif self.has_plug(channel.plug, "shared") and not private:
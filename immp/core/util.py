@@ -15,9 +15,9 @@ except ImportError:
     get_distribution = None
 
 try:
-    from aiohttp import ClientSession
+    from aiohttp import ClientSession, TCPConnector
 except ImportError:
-    ClientSession = None
+    ClientSession = TCPConnector = None
 
 from .error import ConfigError
 from .schema import Schema
@@ -535,6 +535,9 @@ class HTTPOpenable(Openable):
             Managed session object.
     """
 
+    # Extra keyword arguments for the session's connector, e.g. DNS cache or pool limits.
+    _connector_options = {}
+
     def __init__(self):
         super().__init__()
         self.session = None
@@ -547,7 +550,8 @@ class HTTPOpenable(Openable):
             agent = "{}/{}".format(dist.project_name, dist.version)
         else:
             agent = "IMMP"
-        self.session = ClientSession(headers={"User-Agent": agent})
+        connector = TCPConnector(**self._connector_options)
+        self.session = ClientSession(headers={"User-Agent": agent}, connector=connector)
         await super().start()
 
     async def stop(self):
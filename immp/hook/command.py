@@ -40,6 +40,7 @@ import inspect
 import logging
 import re
 import shlex
+from time import monotonic
 
 import immp
 
@@ -47,6 +48,29 @@ import immp
 log = logging.getLogger(__name__)
 
 
+def _command_attrs(cls):
+    # Names of command attributes across the class hierarchy, without invoking any descriptors.
+    # Sorted to match dir(), so that the same command wins if two attributes share a name.
+    return sorted({name for base in cls.__mro__ for name, value in vars(base).items()
+                   if isinstance(value, BaseCommand)})
+
+
+# Argument words made of unquoted, double-quoted or single-quoted runs, without any escapes.
+_shlex_word = r"""(?:[^ \t\r\n"'\\]|"[^"\\]*"|'[^']*')+"""
+_shlex_words = re.compile(_shlex_word)
+_shlex_line = re.compile(r"[ \t\r\n]*(?:{0}(?:[ \t\r\n]+{0})*)?[ \t\r\n]*".format(_shlex_word))
+_shlex_part = re.compile(r""""([^"]*)"|'([^']*)'|([^"']+)""")
+
+
+def _shlex_split(text):
+    # Equivalent to shlex.split() for the common case of simple quoting, falling back to the full
+    # tokeniser for backslash escapes or unbalanced quotes.
+    if "\\" in text or not _shlex_line.fullmatch(text):
+        return shlex.split(text)
+    return ["".join(double or single or bare for double, single, bare in _shlex_part.findall(word))
+            for word in _shlex_words.findall(text)]
+
+
 class BadUsage(immp.HookError):
     """
     May be raised from within a command to indicate that the arguments were invalid.
@@ -101,9 +125,38 @@ class BoundCommand:
     This object is callable, which invokes the command's underlying method against the bound hook.
     """
 
+    __slots__ = ("hook", "cmd", "name", "scope", "sync_aware")
+
+    # Command scopes usable in private (True) or shared (False) channels.
+    _scopes = {True: frozenset((CommandScope.anywhere, CommandScope.private)),
+               False: frozenset((CommandScope.anywhere, CommandScope.shared))}
+
     def __init__(self, hook, cmd):
         self.hook = hook
         self.cmd = cmd
+        # Copy the attributes used when filtering and dispatching commands, to avoid going through
+        # __getattr__ for each lookup.  Dynamic commands don't have a name until completed.
+        self.name = cmd.name if isinstance(cmd, FullCommand) else None
+        self.scope = cmd.scope
+        self.sync_aware = cmd.sync_aware
+
+    @property
+    def fn(self):
+        return self.cmd.fn
+
+    @property
+    def doc(self):
+        return self.cmd.doc
+
+    @property
+    def spec(self):
+        return self.cmd.spec
+
+    def parse(self, args):
+        return self.cmd.parse(args)
+
+    def valid(self, *args):
+        self.cmd.valid(*args)
 
     def applicable(self, channel, user, private):
         """
@@ -121,9 +174,7 @@ class BoundCommand:
             bool:
                 ``True`` if the command may be used.
         """
-        if self.scope == CommandScope.private and not private:
-            return False
-        elif self.scope == CommandScope.shared and private:
+        if self.scope not in self._scopes[bool(private)]:
             return False
         elif self.cmd.test:
             return self.cmd.test(self.hook, channel, user)
@@ -153,7 +204,10 @@ class BoundCommand:
             return await self.cmd.fn(self.hook, *self.cmd.fixed_args, msg, *args)
 
     def __getattr__(self, name):
-        # Propagate other attribute access to the unbound command object.
+        # Propagate other attribute access to the unbound command object.  Special attributes
+        # (e.g. __dict__) are excluded, as they describe the wrapper rather than the command.
+        if name.startswith("__"):
+            raise AttributeError(name)
         return getattr(self.cmd, name)
 
     def __eq__(self, other):
@@ -203,15 +257,26 @@ class BaseCommand:
         self.scope = scope
         self.test = test
         self.sync_aware = sync_aware
+        # The signature is fixed, so inspect it once here rather than on every command usage.
+        self._args = self._split_args(fn)
+        params = self._args[1]
         # Only positional arguments are produced by splitting the input, there are no keywords.
         if any(param.kind in (inspect.Parameter.KEYWORD_ONLY,
-                              inspect.Parameter.VAR_KEYWORD) for param in self._args[1]):
+                              inspect.Parameter.VAR_KEYWORD) for param in params):
             raise ValueError("Keyword-only command parameters are not supported: {}".format(fn))
-
-    @property
-    def _args(self):
+        self.fixed = len(self._args[0])
+        self.min = len([arg for arg in params if arg.default is inspect.Parameter.empty])
+        self.max = len(params)
+        self._varargs = any(arg.kind is inspect.Parameter.VAR_POSITIONAL for arg in params)
+        self.spec = self._spec(params)
+        self.doc = inspect.cleandoc(fn.__doc__) if fn.__doc__ else None
+        # Parse mode is also fixed, so pick the matching implementation up front.
+        self._parse = getattr(self, self._parsers[parser])
+
+    @staticmethod
+    def _split_args(fn):
         # Skip `self` argument.
-        params = tuple(inspect.signature(self.fn).parameters.values())[1:]
+        params = tuple(inspect.signature(fn).parameters.values())[1:]
         # Split on `msg` argument into fixed and called arguments.
         for i, param in enumerate(params):
             if param.name == "msg":
@@ -219,26 +284,10 @@ class BaseCommand:
         else:
             raise ValueError("Command method doesn't accept a `msg` parameter")
 
-    @property
-    def fixed(self):
-        return len(self._args[0])
-
-    @property
-    def min(self):
-        return len([arg for arg in self._args[1] if arg.default is inspect.Parameter.empty])
-
-    @property
-    def max(self):
-        return len(self._args[1])
-
-    @property
-    def doc(self):
-        return inspect.cleandoc(self.fn.__doc__) if self.fn.__doc__ else None
-
-    @property
-    def spec(self):
+    @staticmethod
+    def _spec(params):
         parts = []
-        for param in self._args[1]:
+        for param in params:
             if param.kind in (inspect.Parameter.POSITIONAL_ONLY,
                               inspect.Parameter.POSITIONAL_OR_KEYWORD):
                 parts.append(("<{}>" if param.default is inspect.Parameter.empty else "[{}]")
@@ -247,6 +296,32 @@ class BaseCommand:
                 parts.append("[{}...]".format(param.name))
         return " ".join(parts)
 
+    def _parse_spaces(self, args):
+        return str(args).split()
+
+    def _parse_shlex(self, args):
+        return _shlex_split(str(args))
+
+    def _parse_hybrid(self, args):
+        filled = self.max
+        parts = str(args).split(maxsplit=filled - 1)
+        if len(parts) < filled:
+            return parts
+        full = re.split(r"(\s+)", str(args))
+        index = filled * 2
+        if full[0]:
+            index -= 2
+        offset = len("".join(full[:index]))
+        return parts[:-1] + [args[offset::True]]
+
+    def _parse_none(self, args):
+        return [args]
+
+    _parsers = {CommandParser.spaces: "_parse_spaces",
+                CommandParser.shlex: "_parse_shlex",
+                CommandParser.hybrid: "_parse_hybrid",
+                CommandParser.none: "_parse_none"}
+
     def parse(self, args):
         """
         Convert a string of multiple arguments into a list according to the chosen parse mode.
@@ -259,25 +334,7 @@ class BaseCommand:
             (str or RichText) list:
                 Parsed arguments.
         """
-        if not args:
-            return []
-        if self.parser == CommandParser.spaces:
-            return str(args).split()
-        elif self.parser == CommandParser.shlex:
-            return shlex.split(str(args))
-        elif self.parser == CommandParser.hybrid:
-            filled = self.max
-            parts = str(args).split(maxsplit=filled - 1)
-            if len(parts) < filled:
-                return parts
-            full = re.split(r"(\s+)", str(args))
-            index = filled * 2
-            if full[0]:
-                index -= 2
-            offset = len("".join(full[:index]))
-            return parts[:-1] + [args[offset::True]]
-        else:
-            return [args]
+        return self._parse(args) if args else []
 
     def valid(self, *args):
         """
@@ -288,13 +345,12 @@ class BaseCommand:
             args (str list):
                 Parsed arguments.
         """
-        params = self._args[1]
-        varargs = len([arg for arg in params if arg.kind is inspect.Parameter.VAR_POSITIONAL])
-        required = self.min - varargs
+        # Any *args parameter has no default, but doesn't require a value.
+        required = self.min - self._varargs
         if len(args) < required:
             raise ValueError("Expected at least {} args, got {}".format(required, len(args)))
-        if len(args) > len(params) and not varargs:
-            raise ValueError("Expected at most {} args, got {}".format(len(params), len(args)))
+        if len(args) > self.max and not self._varargs:
+            raise ValueError("Expected at most {} args, got {}".format(self.max, len(args)))
 
     def complete(self, name, *args):
         """
@@ -427,11 +483,56 @@ class CommandHook(immp.Hook):
                                             immp.Optional("identify", dict): {str: [str]},
                                             immp.Optional("sets", list): [str]}}})
 
+    # Channel privacy rarely changes, so reuse lookups for a short while.
+    _private_ttl = 60
+    _private_limit = 1024
+
     def __init__(self, name, config, host):
         super().__init__(name, config, host)
         # Avoiding circular dependency between commands and sync -- use the full path to populate
         # that attribute path in the global `immp` import for later (so unused here).
         import immp.hook.sync  # noqa
+        self._prepare_config()
+        # Recent privacy lookups, keyed by plug name and channel source (channels are mutable).
+        self._private = {}
+
+    def _prepare_config(self):
+        # Derive lookup structures from config, refreshed whenever our config changes.
+        # Messages are matched case-insensitively, so do the same for the prefixes.
+        self._prefixes = tuple(prefix.lower() for prefix in self.config["prefix"])
+        # Possible first characters of a command, or None if an empty prefix matches anything.
+        starts = frozenset(prefix[:1] for prefix in self._prefixes)
+        self._prefix_starts = None if "" in starts else starts
+        # Accepted roles for each identity provider of each mapping, as sets for quick matching.
+        self._roles = {label: {name: frozenset(roles)
+                               for name, roles in mapping["identify"].items()}
+                       for label, mapping in self.config["mapping"].items()}
+
+    def _maybe_command(self, text):
+        # Check the first character before converting the whole text to a string.
+        if self._prefix_starts is None:
+            return True
+        elif isinstance(text, str):
+            first = text[:1]
+        else:
+            first = next((segment.text[0] for segment in text if segment.text), "")
+        return first.lower()[:1] in self._prefix_starts
+
+    async def _is_private(self, channel):
+        key = (channel.plug.name, channel.source)
+        now = monotonic()
+        cached = self._private.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        private = await channel.is_private()
+        if key not in self._private and len(self._private) >= self._private_limit:
+            del self._private[next(iter(self._private))]
+        self._private[key] = (private, now + self._private_ttl)
+        return private
+
+    def on_config_change(self, source):
+        if source is self:
+            self._prepare_config()
 
     def discover(self, hook):
         """
@@ -443,24 +544,30 @@ class CommandHook(immp.Hook):
         """
         if hook.state != immp.OpenState.active:
             return {}
-        attrs = [getattr(hook, attr) for attr in dir(hook)]
+        # Only check attributes declared as commands, rather than scanning everything in dir().
+        attrs = [getattr(hook, attr) for attr in _command_attrs(type(hook))]
         cmds = {cmd.name: cmd for cmd in attrs if isinstance(cmd, BoundCommand)
                 and isinstance(cmd.cmd, FullCommand)}
         if isinstance(hook, DynamicCommands):
             cmds.update({cmd.name: cmd for cmd in hook.commands()})
         return cmds
 
-    def _mapping_cmds(self, mapping, channel, user, private):
-        cmdgroup = set()
+    def _discover_cached(self, discovered, name):
+        # Hooks may appear in several mappings and sets, so only scan each one once per lookup.
+        if name not in discovered:
+            discovered[name] = self.discover(self.host.hooks[name])
+        return discovered[name]
+
+    def _mapping_cmds(self, mapping, discovered):
+        # May yield the same command more than once, if included by multiple hooks or sets.
         for name in mapping["hooks"]:
-            cmdgroup.update(set(self.discover(self.host.hooks[name]).values()))
+            yield from self._discover_cached(discovered, name).values()
         for label in mapping["sets"]:
             for name, cmdset in self.config["sets"][label].items():
-                discovered = self.discover(self.host.hooks[name])
-                cmdgroup.update(set(discovered[cmd] for cmd in cmdset))
-        return {cmd for cmd in cmdgroup if cmd.applicable(channel, user, private)}
+                cmds = self._discover_cached(discovered, name)
+                yield from (cmds[cmd] for cmd in cmdset)
 
-    async def commands(self, channel, user):
+    async def commands(self, channel, user, only=None):
         """
         Retrieve all commands, and filter against the mappings.
 
@@ -469,6 +576,8 @@ class CommandHook(immp.Hook):
                 Source channel where the command will be executed.
             user (.User):
                 Author of the message to trigger the command.
+            only (str):
+                Only consider commands with this name, if looking for a specific command.
 
         Returns:
             (str, .BoundCommand) dict:
@@ -482,11 +591,13 @@ class CommandHook(immp.Hook):
             private = False
         else:
             plug = None
-            private = await channel.is_private()
+            private = await self._is_private(channel)
         mappings = []
         identities = {}
+        # Mappings often share groups, so only test membership of each group once.
+        members = {}
         for label, mapping in self.config["mapping"].items():
-            providers = mapping["identify"]
+            providers = self._roles[label]
             if providers:
                 for name, roles in providers.items():
                     if name not in identities:
@@ -500,25 +611,40 @@ class CommandHook(immp.Hook):
                             continue
                     if not identities[name]:
                         continue
-                    elif not roles or set(roles).intersection(identities[name].roles):
+                    elif not roles or not roles.isdisjoint(identities[name].roles):
                         log.debug("Identified %r as %r for map %r", user, identities[name], label)
                         break
                 else:
                     log.debug("Could not identify %r for map %r, skipping", user, label)
                     continue
             for name in mapping["groups"]:
-                group = self.host.groups[name]
-                if plug and group.has_plug(plug, "anywhere", "named"):
-                    mappings.append(mapping)
-                elif not plug and await group.has_channel(channel):
+                if name not in members:
+                    group = self.host.groups[name]
+                    if plug:
+                        members[name] = group.has_plug(plug, "anywhere", "named")
+                    else:
+                        members[name] = await group.has_channel(channel, private)
+                if members[name]:
                     mappings.append(mapping)
-        cmds = set()
+                    break
+        mapped = {}
+        skipped = set()
+        discovered = {}
         for mapping in mappings:
-            cmds.update(self._mapping_cmds(mapping, channel, user, private))
-        mapped = {cmd.name: cmd for cmd in cmds}
-        if len(cmds) > len(mapped):
-            # Mapping by name silently overwrote at least one command with a duplicate name.
-            raise immp.ConfigError("Multiple applicable commands with the same name")
+            for cmd in self._mapping_cmds(mapping, discovered):
+                if only and cmd.name != only:
+                    # Skip testing the applicability of commands that aren't wanted.
+                    continue
+                existing = mapped.get(cmd.name)
+                # Commands may be reachable via multiple mappings, so only test each one once.
+                if existing == cmd or cmd in skipped:
+                    continue
+                elif not cmd.applicable(channel, user, private):
+                    skipped.add(cmd)
+                elif existing:
+                    raise immp.ConfigError("Multiple applicable commands with the same name")
+                else:
+                    mapped[cmd.name] = cmd
         return mapped
 
     @command("help", sync_aware=True)
@@ -526,7 +652,7 @@ class CommandHook(immp.Hook):
         """
         List all available commands in this channel, or show help about a single command.
         """
-        if await msg.channel.is_private():
+        if await self._is_private(msg.channel):
             current = None
             private = msg.channel
         else:
@@ -534,12 +660,12 @@ class CommandHook(immp.Hook):
             private = await msg.user.private_channel()
         parts = defaultdict(dict)
         if current:
-            parts[current] = await self.commands(current, msg.user)
+            parts[current] = await self.commands(current, msg.user, command)
         if private:
-            parts[private] = await self.commands(private, msg.user)
+            parts[private] = await self.commands(private, msg.user, command)
             for name in parts[private]:
                 parts[current].pop(name, None)
-        parts[None] = await self.commands(msg.channel.plug, msg.user)
+        parts[None] = await self.commands(msg.channel.plug, msg.user, command)
         for name in parts[None]:
             if private:
                 parts[private].pop(name, None)
@@ -568,41 +694,41 @@ class CommandHook(immp.Hook):
             if current:
                 titles[current] = [immp.Segment("Commands for ", bold=True),
                                    immp.Segment(await current.title(), bold=True, italic=True)]
-            text = immp.RichText()
+            # Collect all segments first, and build the rich text in one go.
+            segments = []
             for channel, cmds in parts.items():
                 if not cmds:
                     continue
-                if text:
-                    text.append(immp.Segment("\n"))
-                text.append(*titles[channel])
+                if segments:
+                    segments.append(immp.Segment("\n"))
+                segments.extend(titles[channel])
                 for name, cmd in sorted(cmds.items()):
-                    text.append(immp.Segment("\n- {}".format(name)))
+                    segments.append(immp.Segment("\n- {}".format(name)))
                     if cmd.spec:
-                        text.append(immp.Segment(" {}".format(cmd.spec), italic=True))
+                        segments.append(immp.Segment(" {}".format(cmd.spec), italic=True))
+            text = immp.RichText(segments)
         await msg.channel.send(immp.Message(text=text))
 
     async def on_receive(self, sent, source, primary):
         await super().on_receive(sent, source, primary)
         if not primary or not sent.user or not sent.text or sent != source:
             return
+        elif not self._maybe_command(sent.text):
+            return
         plain = str(sent.text)
-        raw = None
-        for prefix in self.config["prefix"]:
-            if plain.lower().startswith(prefix):
-                raw = plain[len(prefix):].split(maxsplit=1)
-                break
+        lowered = plain.lower()
+        if not lowered.startswith(self._prefixes):
+            return
+        prefix = next(prefix for prefix in self._prefixes if lowered.startswith(prefix))
+        raw = plain[len(prefix):].split(maxsplit=1)
         if not raw:
             return
         # Sync integration: exclude native channels of syncs from command execution.
         if isinstance(sent.channel.plug, immp.hook.sync.SyncPlug):
             log.debug("Suppressing command in virtual sync channel: %r", sent.channel)
             return
-        synced = immp.hook.sync.SyncPlug.any_sync(self.host, sent.channel)
-        if synced:
-            log.debug("Mapping command channel: %r -> %r", sent.channel, synced)
         name = raw[0].lower()
-        trailing = sent.text[-len(raw[1])::True] if len(raw) == 2 else None
-        cmds = await self.commands(sent.channel, sent.user)
+        cmds = await self.commands(sent.channel, sent.user, name)
         try:
             cmd = cmds[name]
         except KeyError:
@@ -610,6 +736,11 @@ class CommandHook(immp.Hook):
             return
         else:
             log.debug("Matched command in %r: %r", sent.channel, cmd)
+        # Only look for a sync once we know the message is a command.
+        synced = immp.hook.sync.SyncPlug.any_sync(self.host, sent.channel)
+        if synced:
+            log.debug("Mapping command channel: %r -> %r", sent.channel, synced)
+        trailing = sent.text[-len(raw[1])::True] if len(raw) == 2 else None
         try:
             args = cmd.parse(trailing)
             cmd.valid(*args)
@@ -407,11 +407,8 @@ class SyncPlug(immp.Plug):
             .Channel:
                 Sync channel containing the given channel as a source, or ``None`` if not synced.
         """
-        synced = [plug.sync_for(channel) for plug in host.plugs.values() if isinstance(plug, cls)]
-        try:
-            return next(filter(None, synced))
-        except StopIteration:
-            return None
+        synced = (plug.sync_for(channel) for plug in host.plugs.values() if isinstance(plug, cls))
+        return next(filter(None, synced), None)
 
     def sync_for(self, channel):
         """
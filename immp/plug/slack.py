@@ -8,6 +8,9 @@ Requirements:
 
     `emoji <https://github.com/carpedm20/emoji/>`_
 
+    `orjson <https://github.com/ijl/orjson>`_:
+        Optional, used in place of the standard library to decode API responses and events.
+
 Config:
     token (str):
         Slack API user or bot token (``xoxb`` prefix).
@@ -72,29 +75,63 @@ attributed to its identifier rather than name).
 
 from asyncio import CancelledError, ensure_future, gather, Lock, sleep
 from copy import copy
-from collections import defaultdict
 from datetime import datetime, timezone
-from functools import partial
+from functools import lru_cache, partial
 from json import dumps as json_dumps
 import logging
+from operator import itemgetter
 import re
 import time
 
 from aiohttp import ClientResponseError, FormData
 from emoji import emojize
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 import immp
 
 
 log = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1024)
+def _action_regex(user):
+    # Own username at the start of the message, used to represent an action.
+    return re.compile(r"<@{}(\|.*?)?> ".format(re.escape(user)))
+
+
+@lru_cache(maxsize=16)
+def _archive_regex(domain):
+    # Archive links to messages, either anywhere in the text or making up the entire body.
+    link = r"https://{}.slack.com/archives/([^/]+)/p([0-9]+)".format(re.escape(domain))
+    return re.compile(link), re.compile("^<{}>$".format(link))
+
+
+@lru_cache(maxsize=64)
+def _api_url(endpoint):
+    return "https://slack.com/api/{}".format(endpoint)
+
+
+@lru_cache(maxsize=4)
+def _auth_headers(token):
+    # Shared between requests, so must not be modified by callers.
+    return {"Authorization": "Bearer {}".format(token)}
+
+
+@lru_cache(maxsize=4096)
+def _emojize(text):
+    return emojize(text, language="alias")
+
+
 class _Schema:
 
-    image_sizes = ("original", "512", "192", "72", "48", "32", "24")
+    image_keys = tuple("image_{}".format(size)
+                       for size in ("original", "512", "192", "72", "48", "32", "24"))
 
-    _images = {immp.Optional("image_{}".format(size)): immp.Nullable(str)
-               for size in image_sizes}
+    _images = {immp.Optional(key): immp.Nullable(str) for key in image_keys}
 
     config = immp.Schema({"token": str,
                           immp.Optional("app-token"): immp.Nullable(str),
@@ -158,59 +195,89 @@ class _Schema:
                   "text": str,
                   **_base_msg}
 
-    message = immp.Schema(immp.Any({"subtype": "file_comment", **_base_msg},
-                                   {"subtype": "message_changed", **_base_msg},
-                                   {"subtype": "message_deleted", "deleted_ts": str, **_base_msg},
-                                   {"subtype": immp.Any("channel_name", "group_name"),
-                                    "name": str, **_plain_msg},
-                                   {immp.Optional("subtype"): immp.Nullable(str), **_plain_msg}))
+    _subtype_msgs = {"file_comment": {"subtype": "file_comment", **_base_msg},
+                     "message_changed": {"subtype": "message_changed", **_base_msg},
+                     "message_deleted": {"subtype": "message_deleted", "deleted_ts": str,
+                                         **_base_msg},
+                     "channel_name": {"subtype": "channel_name", "name": str, **_plain_msg},
+                     "group_name": {"subtype": "group_name", "name": str, **_plain_msg}}
+
+    plain_message = immp.Schema({immp.Optional("subtype"): immp.Nullable(str), **_plain_msg})
+
+    message = immp.Schema(immp.Any(*_subtype_msgs.values(), plain_message))
 
     # Circular references to embedded messages.
-    message.raw.choices[1].update({"message": message, "previous_message": message})
-
-    event = immp.Schema(immp.Any(message,
-                                 {"type": "team_pref_change",
-                                  "name": str,
-                                  "value": immp.Any()},
-                                 {"type": immp.Any("team_join", "user_change"),
-                                  "user": user},
-                                 {"type": immp.Any("channel_created", "channel_joined",
-                                                   "channel_rename", "group_created",
-                                                   "group_joined", "group_rename"),
-                                  "channel": {"id": str, "name": str}},
-                                 {"type": "im_created",
-                                  "channel": {"id": str}},
-                                 {"type": immp.Any("member_joined_channel", "member_left_channel"),
-                                  "user": str,
-                                  "channel": str},
-                                 {"type": "message",
-                                  immp.Optional("subtype"): immp.Nullable(str)},
-                                 {"type": str}))
+    _subtype_msgs["message_changed"].update({"message": message, "previous_message": message})
+
+    subtype_messages = {subtype: immp.Schema(fields) for subtype, fields in _subtype_msgs.items()}
+
+    @staticmethod
+    def message_event(json):
+        # Equivalent to the message schema, but picks the choice matching the message subtype,
+        # rather than testing each choice in turn.
+        subtype = json.get("subtype") if isinstance(json, dict) else None
+        if isinstance(subtype, str) and subtype in _Schema.subtype_messages:
+            try:
+                return _Schema.subtype_messages[subtype](json)
+            except immp.Invalid:
+                pass
+        return _Schema.plain_message(json)
+
+    # Messages are only checked for their subtype here, and are validated in full when parsed.
+    _event_fields = {"message": {immp.Optional("subtype"): immp.Nullable(str)},
+                     "team_pref_change": {"name": str, "value": immp.Any()},
+                     "team_join": {"user": user},
+                     "user_change": {"user": user},
+                     "im_created": {"channel": {"id": str}},
+                     "member_joined_channel": {"user": str, "channel": str},
+                     "member_left_channel": {"user": str, "channel": str},
+                     **{type_: {"channel": {"id": str, "name": str}}
+                        for type_ in ("channel_created", "channel_joined", "channel_rename",
+                                      "group_created", "group_joined", "group_rename")}}
+
+    events = {type_: immp.Schema({"type": type_, **fields})
+              for type_, fields in _event_fields.items()}
+
+    any_event = immp.Schema({"type": str})
+
+    @staticmethod
+    def event(json):
+        # Pick the schema for the given event type, rather than testing each schema in turn.
+        event = _Schema.any_event(json)
+        schema = _Schema.events.get(event["type"])
+        if not schema:
+            return event
+        try:
+            return schema(json)
+        except immp.Invalid:
+            return event
 
     socket_event = immp.Schema(immp.Any({"type": "events_api",
                                          immp.Optional("envelope_id"): immp.Nullable(str),
                                          "payload": {"type": "event_callback",
-                                                     "event": event}},
+                                                     "event": any_event}},
                                         {"type": str,
                                          immp.Optional("envelope_id"): immp.Nullable(str)}))
 
+    # Responses are checked for errors before validation, so only successful ones are described
+    # here.  Users, bots and messages are validated in full when parsed, so avoid doing so twice.
     def _api(nested={}):
-        return immp.Schema(immp.Any({"ok": True,
-                                     immp.Optional("response_metadata", dict):
-                                         {immp.Optional("next_cursor", ""): str},
-                                     **nested},
-                                    {"ok": False,
-                                     "error": str}))
+        return immp.Schema({"ok": True,
+                            immp.Optional("response_metadata", dict):
+                                {immp.Optional("next_cursor", ""): str},
+                            **nested})
+
+    api_error = immp.Schema({"ok": False, "error": str})
 
     socket_open = _api({"url": str})
     auth_test = _api({"user_id": str})
     team_info = _api({"team": {"id": str, "name": str, "domain": str}})
-    users_list = _api({"members": [user]})
-    bot_info = _api({"bot": bot})
+    users_list = _api({"members": [dict]})
+    bot_info = _api({"bot": dict})
     convs_list = _api({"channels": [_channel]})
     conv_open = _api({"channel": direct})
     conv_members = _api({"members": [str]})
-    conv_history = _api({"messages": [message]})
+    conv_history = _api({"messages": [{"ts": str}]})
     chat_post = _api({"channel": str, "message": message})
     file_upload = _api({"file": file})
 
@@ -237,6 +304,8 @@ class SlackUser(immp.User):
             Reference to the Slack integration app for a bot user.
     """
 
+    __slots__ = ("_display_name", "_real_name", "_real_name_override", "bot_id", "app")
+
     def __init__(self, id_=None, plug=None, display_name=None, real_name=None, avatar=None,
                  bot_id=None, app=False, raw=None):
         super().__init__(id_=id_,
@@ -273,10 +342,7 @@ class SlackUser(immp.User):
 
     @classmethod
     def _best_image(cls, profile):
-        for size in _Schema.image_sizes:
-            if "image_{}".format(size) in profile:
-                return profile["image_{}".format(size)]
-        return None
+        return next((profile[key] for key in _Schema.image_keys if key in profile), None)
 
     @classmethod
     def from_member(cls, slack, json):
@@ -332,10 +398,13 @@ class SlackRichText(immp.RichText):
     Wrapper for Slack-specific parsing of formatting.
     """
 
+    __slots__ = ()
+
     # If bold comes before italic here, "<b,i,l=http://example.com>B+I+L</> <i>just I</>" becomes
     # "*_<http://example.com|B+I+L>_* _just I_" and the first segment's italic breaks.  For some
     # reason this doesn't happen with bold and italic swapped here and in the text.
     tags = {"_": "italic", "*": "bold", "~": "strike", "`": "code", "```": "pre"}
+    _tag_items = tuple(tags.items())
     # A rather complicated expression to match formatting tags according to the following rules:
     # 1) Outside of formatting may not be adjacent to alphanumeric or other formatting characters.
     # 2) Inside of formatting may not be adjacent to whitespace or the current formatting character.
@@ -347,20 +416,27 @@ class SlackRichText(immp.RichText):
     _inside_chars = r"\s\1"
     _format_regex = re.compile(r"(?<![{0}\\])({1})(?![{2}])(.+?)(?<![{2}\\])\1(?![{0}])"
                                .format(_outside_chars, _tag_chars, _inside_chars))
+    # Formatting tags nested beyond this are left in the text as-is.
+    _format_depth = 8
     _pre_regex = re.compile(r"```\n?(.+?)\n?```", re.DOTALL)
 
-    _link_regex = re.compile(r"<([^@#\|][^\|>]*?)(?:\|([^>]+?))?>")
-    _mention_regex = re.compile(r"<@([^\|>]+?)(?:\|[^>]+?)?>")
-    _channel_regex = re.compile(r"<#([^\|>]+?)(?:\|[^>]+?)?>")
-
-    @classmethod
-    def _sub_channel(cls, slack, match):
-        return "#{}".format(slack._channels[match.group(1)]["name"])
+    # User mentions, channel tags and links, with optional labels, matched in a single pass.
+    _ref_regex = re.compile(r"<(?:@(?P<user>[^\|>]+?)(?:\|[^>]+?)?"
+                            r"|#(?P<channel>[^\|>]+?)(?:\|[^>]+?)?"
+                            r"|(?P<link>[^@#\|][^\|>]*?)(?:\|(?P<label>[^>]+?))?)>")
+    # Characters that may need parsing: formatting tags, link tags, emoji and HTML entities.
+    _special_regex = re.compile(r"[*_~`<:&]")
 
     @classmethod
-    def _sub_link(cls, match):
-        # Use a label if we have one, else just show the URL.
-        return match.group(2) or match.group(1)
+    def _sub_ref(cls, slack, match):
+        if match.group("channel"):
+            return "#{}".format(slack._channels[match.group("channel")]["name"])
+        elif match.group("link"):
+            # Use a label if we have one, else just show the URL.
+            return match.group("label") or match.group("link")
+        else:
+            # Mentions are handled separately as their own segments.
+            return match.group(0)
 
     @classmethod
     def _escape(cls, text):
@@ -370,6 +446,29 @@ class SlackRichText(immp.RichText):
     def _unescape(cls, text):
         return text.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
 
+    @classmethod
+    def _strip_format(cls, text, offset, changes, depth=0):
+        # Remove formatting tags from the text, and record the range where each format is applied
+        # relative to the stripped text.  Tags may be nested, so also parse inside each match, up
+        # to a limit so that pathological input can't exhaust the stack or hold many copies.
+        parts = []
+        length = offset
+        last = 0
+        for match in cls._format_regex.finditer(text):
+            before = text[last:match.start()]
+            length += len(before)
+            field = cls.tags[match.group(1)]
+            changes.append((length, field, True))
+            inner = match.group(2)
+            if depth < cls._format_depth:
+                inner = cls._strip_format(inner, length, changes, depth + 1)
+            length += len(inner)
+            changes.append((length, field, False))
+            parts += (before, inner)
+            last = match.end()
+        parts.append(text[last:])
+        return "".join(parts)
+
     @classmethod
     async def from_mrkdwn(cls, slack, text):
         """
@@ -385,69 +484,60 @@ class SlackRichText(immp.RichText):
             .SlackRichText:
                 Parsed rich text container.
         """
-        changes = defaultdict(dict)
-        plain = ""
-        done = False
-        while not done:
-            # Identify pre blocks, parse formatting only outside of them.
-            match = cls._pre_regex.search(text)
-            if match:
-                parse = text[:match.start()]
-                pre = match.group(1)
-                text = text[match.end():]
-            else:
-                parse = text
-                done = True
-            offset = len(plain)
-            while True:
-                match = cls._format_regex.search(parse)
-                if not match:
-                    break
-                start = match.start()
-                end = match.end()
-                tag = match.group(1)
-                # Strip the tag characters from the message.
-                parse = parse[:start] + match.group(2) + parse[end:]
-                end -= 2 * len(tag)
-                # Record the range where the format is applied.
-                field = cls.tags[tag]
-                changes[offset + start][field] = True
-                changes[offset + end][field] = False
-                # Shift any future tags back.
-                for pos in sorted(changes):
-                    if pos > offset + end:
-                        changes[pos - 2 * len(tag)].update(changes.pop(pos))
-            plain += parse
-            if not done:
-                changes[len(plain)]["pre"] = True
-                changes[len(plain + pre)]["pre"] = False
-                plain += pre
-        for match in cls._link_regex.finditer(plain):
-            # Store the link target; the link tag will be removed after segmenting.
-            changes[match.start()]["link"] = cls._unescape(match.group(1))
-            changes[match.end()]["link"] = None
-        for match in cls._mention_regex.finditer(plain):
-            changes[match.start()]["mention"] = await slack.user_from_id(match.group(1))
-            changes[match.end()]["mention"] = None
+        if not cls._special_regex.search(text):
+            # Nothing to parse, just use the text as-is.
+            return cls([immp.Segment(text)] if text else [])
+        # List of (offset, field, value) formatting changes, applied in order.
+        changes = []
+        parts = []
+        length = 0
+        last = 0
+        # Identify pre blocks, parse formatting only outside of them.
+        for match in cls._pre_regex.finditer(text):
+            parse = cls._strip_format(text[last:match.start()], length, changes)
+            pre = match.group(1)
+            parts += (parse, pre)
+            length += len(parse)
+            changes.append((length, "pre", True))
+            length += len(pre)
+            changes.append((length, "pre", False))
+            last = match.end()
+        parts.append(cls._strip_format(text[last:], length, changes))
+        plain = "".join(parts)
+        for match in cls._ref_regex.finditer(plain):
+            if match.group("link"):
+                # Store the link target; the link tag will be removed after segmenting.
+                changes.append((match.start(), "link", cls._unescape(match.group("link"))))
+                changes.append((match.end(), "link", None))
+            elif match.group("user"):
+                user = await slack.user_from_id(match.group("user"))
+                changes.append((match.start(), "mention", user))
+                changes.append((match.end(), "mention", None))
+        # Sorting is stable, so changes at the same offset keep the order they were recorded in.
+        changes.sort(key=itemgetter(0))
+        changes.append((len(plain), None, None))
         segments = []
-        points = list(sorted(changes.keys()))
         formatting = {}
-        # Iterate through text in change start/end pairs.
-        for start, end in zip([0] + points, points + [len(plain)]):
-            formatting.update(changes[start])
-            if start == end:
-                # Zero-length segment at the start or end, ignore it.
-                continue
-            if formatting.get("mention"):
-                user = formatting["mention"]
-                part = "@{}".format(user.real_name)
-            else:
-                part = plain[start:end]
-                # Strip Slack channel tags, replace with a plain-text representation.
-                part = cls._channel_regex.sub(partial(cls._sub_channel, slack), part)
-                part = cls._link_regex.sub(cls._sub_link, part)
-                part = emojize(cls._unescape(part), language="alias")
-            segments.append(immp.Segment(part, **formatting))
+        start = 0
+        # Walk through the changes, making a segment each time we move past some text.
+        for end, field, value in changes:
+            if end > start:
+                if formatting.get("mention"):
+                    user = formatting["mention"]
+                    part = "@{}".format(user.real_name)
+                else:
+                    part = plain[start:end]
+                    if "<" in part:
+                        # Strip Slack channel and link tags, replace with a plain-text form.
+                        part = cls._ref_regex.sub(partial(cls._sub_ref, slack), part)
+                    part = cls._unescape(part)
+                    if ":" in part:
+                        # Only text with colons can contain emoji shortcodes.
+                        part = _emojize(part)
+                segments.append(immp.Segment(part, **formatting))
+                start = end
+            if field:
+                formatting[field] = value
         return cls(segments)
 
     @classmethod
@@ -465,19 +555,19 @@ class SlackRichText(immp.RichText):
             str:
                 Slack-style formatted text.
         """
-        text = ""
+        parts = []
         active = []
         for segment in rich.normalise():
-            for tag in reversed(active):
+            if active:
                 # Check all existing tags, and remove any that end at this segment.
-                attr = cls.tags[tag]
-                if not getattr(segment, attr):
-                    text += tag
-                    active.remove(tag)
-            for tag, attr in cls.tags.items():
+                ending = [tag for tag in reversed(active) if not getattr(segment, cls.tags[tag])]
+                if ending:
+                    parts.extend(ending)
+                    active = [tag for tag in active if tag not in ending]
+            for tag, attr in cls._tag_items:
                 # Add any new tags that start at this segment.
                 if getattr(segment, attr) and tag not in active:
-                    text += tag
+                    parts.append(tag)
                     active.append(tag)
             parsed = cls._escape(segment.text)
             if not segment.code and not segment.pre:
@@ -490,11 +580,10 @@ class SlackRichText(immp.RichText):
                     link = segment.mention.link
                 if link:
                     parsed = "<{}|{}>".format(link, cls._escape(segment.text))
-            text += parsed
-        for tag in reversed(active):
-            # Close all remaining tags.
-            text += tag
-        return text
+            parts.append(parsed)
+        # Close all remaining tags.
+        parts.extend(reversed(active))
+        return "".join(parts)
 
 
 class SlackFile(immp.File):
@@ -502,6 +591,8 @@ class SlackFile(immp.File):
     File attachment originating from Slack.
     """
 
+    __slots__ = ("slack", "_source")
+
     def __init__(self, slack, title=None, type_=immp.File.Type.unknown, source=None):
         super().__init__(title=title, type_=type_)
         self.slack = slack
@@ -509,8 +600,7 @@ class SlackFile(immp.File):
         self._source = source
 
     async def get_content(self, sess):
-        headers = {"Authorization": "Bearer {}".format(self.slack.config["token"])}
-        return await sess.get(self._source, headers=headers)
+        return await sess.get(self._source, headers=_auth_headers(self.slack.config["token"]))
 
     @classmethod
     def from_file(cls, slack, json):
@@ -548,6 +638,8 @@ class SlackMessage(immp.Message):
     Message originating from Slack.
     """
 
+    __slots__ = ()
+
     _bot_lookup = Lock()
 
     @classmethod
@@ -578,7 +670,7 @@ class SlackMessage(immp.Message):
                 bot_id = event["bot_id"]
                 if bot_id in slack._bot_to_user:
                     # Event has the bot's app ID, not user ID.
-                    author = slack._bot_to_user[bot_id]
+                    user = slack._bot_to_user[bot_id]
                 elif bot_id in slack._bot_to_app:
                     # Slack app with no bot presence, use the app metadata.
                     user = slack._bot_to_app[bot_id]
@@ -616,10 +708,12 @@ class SlackMessage(immp.Message):
         action = False
         reply_to = joined = left = title = None
         attachments = []
-        if user and text and re.match(r"<@{}(\|.*?)?> ".format(user.id), text):
-            # Own username at the start of the message, assume it's an action.
-            action = True
-            text = re.sub(r"^<@{}(\|.*?)?> ".format(user.id), "", text)
+        if user and text and user.id:
+            match = _action_regex(user.id).match(text)
+            if match:
+                # Own username at the start of the message, assume it's an action.
+                action = True
+                text = text[match.end():]
         if event["subtype"] in ("channel_join", "group_join"):
             action = True
             joined = [user]
@@ -677,8 +771,8 @@ class SlackMessage(immp.Message):
             # Messages can be shared either in the UI, or by pasting an archive link.  The latter
             # unfurls async (it comes through as an edit, which we ignore), so instead we can look
             # up the message ourselves and embed it.
-            regex = r"https://{}.slack.com/archives/([^/]+)/p([0-9]+)".format(slack._team["domain"])
-            for channel_id, link in re.findall(regex, text):
+            regex, whole = _archive_regex(slack._team["domain"])
+            for channel_id, link in regex.findall(text):
                 # Archive links are strange and drop the period from the ts value.
                 ts = link[:-6] + "." + link[-6:]
                 refs = [attach.id for attach in attachments if isinstance(attach, immp.Receipt)]
@@ -688,7 +782,7 @@ class SlackMessage(immp.Message):
                         attachments.append(await slack.resolve_message(receipt))
                     except MessageNotFound:
                         pass
-            if re.match("^<{}>$".format(regex), text):
+            if whole.match(text):
                 # Strip the message text if the entire body was just a link.
                 text = None
             else:
@@ -726,7 +820,7 @@ class SlackMessage(immp.Message):
             .SlackMessage:
                 Parsed message object.
         """
-        event = _Schema.message(json)
+        event = _Schema.message_event(json)
         if event["hidden"] and event["subtype"] != "message_changed":
             # Ignore most UI-hidden events (e.g. tombstones of deleted files).
             raise NotImplementedError("hidden")
@@ -863,25 +957,23 @@ class SlackPlug(immp.Plug, immp.HTTPOpenable):
         return isinstance(other, self.__class__) and self._team["id"] == other._team["id"]
 
     async def _api(self, endpoint, schema=_Schema.api, app=False, *, headers=None, **kwargs):
-        headers = headers or {}
         token = app and self.config["app-token"] or self.config["token"]
-        headers["Authorization"] = "Bearer {}".format(token)
+        # Avoid writing the token into the caller's own headers.
+        headers = dict(headers, **_auth_headers(token)) if headers else _auth_headers(token)
         log.debug("User %r making API request to %r", self._bot_user, endpoint)
-        async with self.session.post("https://slack.com/api/{}".format(endpoint),
-                                     headers=headers, **kwargs) as resp:
+        async with self.session.post(_api_url(endpoint), headers=headers, **kwargs) as resp:
             try:
                 resp.raise_for_status()
             except ClientResponseError as e:
                 raise SlackAPIError("Unexpected response code: {}".format(resp.status)) from e
             else:
-                json = await resp.json()
-        data = schema(json)
-        if not data["ok"]:
-            raise SlackAPIError(data["error"])
-        return data
+                json = await resp.json(loads=json_loads)
+        if isinstance(json, dict) and not json.get("ok"):
+            raise SlackAPIError(_Schema.api_error(json)["error"])
+        return schema(json)
 
     async def _paged(self, endpoint, schema, key, app=False, *, params=None, **kwargs):
-        params = params or {}
+        params = dict(params or ())
         items = []
         while True:
             data = await self._api(endpoint, schema, app, params=params, **kwargs)
@@ -910,7 +1002,7 @@ class SlackPlug(immp.Plug, immp.HTTPOpenable):
         self._members = {}
         self._bot_to_app = {}
         # Create a map of bot IDs to users, as the bot cache doesn't contain references to them.
-        self._bot_to_user = {user.bot_id: user.id for user in self._users.values() if user.bot_id}
+        self._bot_to_user = {user.bot_id: user for user in self._users.values() if user.bot_id}
         log.debug("User %r requesting websocket session", self._bot_user)
         if self.config["app-token"]:
             rtm = await self._api("apps.connections.open", _Schema.socket_open, True)
@@ -1089,9 +1181,16 @@ class SlackPlug(immp.Plug, immp.HTTPOpenable):
         log.debug("Reply %r -> %r not found in %r", receipt.id, reply_ts, receipt.channel.source)
         raise MessageNotFound
 
+    async def _upload(self, attach, fields):
+        form = FormData(dict(fields, filename=attach.title or ""))
+        async with (await attach.get_content(self.session)) as img_resp:
+            # Stream the source straight into the upload, releasing the download afterwards.
+            form.add_field("file", img_resp.content, filename="file")
+            upload = await self._api("files.upload", _Schema.file_upload, data=form)
+        return upload["file"]["shares"]
+
     async def _post(self, channel, parent, msg):
         receipts = []
-        uploads = 0
         name = None
         data = {"channel": channel.source}
         if msg.user:
@@ -1103,32 +1202,30 @@ class SlackPlug(immp.Plug, immp.HTTPOpenable):
                 data["icon_url"] = self.config["fallback-image"]
         if not self.config["app-token"]:
             data["as_user"] = False if msg.user else True
-        for attach in msg.attachments:
-            if isinstance(attach, immp.File):
-                # Upload each file to Slack.
-                form = FormData({"channels": channel.source,
-                                 "filename": attach.title or ""})
-                if isinstance(parent.reply_to, immp.Receipt):
-                    # Reply directly to the corresponding thread.  Note that thread_ts can be any
-                    # message in the thread, it need not be resolved to the parent.
-                    form.add_field("thread_ts", msg.reply_to.id)
-                    if self.config["thread-broadcast"]:
-                        form.add_field("broadcast", "true")
-                if name:
-                    comment = immp.RichText([immp.Segment(name, bold=True, italic=True,
-                                                          link=msg.user.link),
-                                             immp.Segment(" uploaded this file", italic=True)])
-                    form.add_field("initial_comment", SlackRichText.to_mrkdwn(self, comment))
-                img_resp = await attach.get_content(self.session)
-                form.add_field("file", img_resp.content, filename="file")
-                upload = await self._api("files.upload", _Schema.file_upload, data=form)
-                uploads += 1
-                for shared in upload["file"]["shares"].values():
+        uploads = [attach for attach in msg.attachments if isinstance(attach, immp.File)]
+        if uploads:
+            # Fields common to all file uploads for this message.
+            fields = {"channels": channel.source}
+            if isinstance(parent.reply_to, immp.Receipt):
+                # Reply directly to the corresponding thread.  Note that thread_ts can be any
+                # message in the thread, it need not be resolved to the parent.
+                fields["thread_ts"] = msg.reply_to.id
+                if self.config["thread-broadcast"]:
+                    fields["broadcast"] = "true"
+            if name:
+                comment = immp.RichText([immp.Segment(name, bold=True, italic=True,
+                                                      link=msg.user.link),
+                                         immp.Segment(" uploaded this file", italic=True)])
+                fields["initial_comment"] = SlackRichText.to_mrkdwn(self, comment)
+            for attach in uploads:
+                # Upload one at a time, so that files appear in attachment order.
+                shares = await self._upload(attach, fields)
+                for shared in shares.values():
                     if channel.source in shared:
                         ids = [share["ts"] for share in shared[channel.source]]
                         receipts += [immp.Receipt(id_, channel) for id_ in ids]
-        if len(receipts) < uploads:
-            log.warning("Missing some file shares: sent %d, got %d", uploads, len(receipts))
+        if len(receipts) < len(uploads):
+            log.warning("Missing some file shares: sent %d, got %d", len(uploads), len(receipts))
         rich = None
         if msg.text:
             rich = msg.text.clone()
@@ -1175,7 +1272,7 @@ class SlackPlug(immp.Plug, immp.HTTPOpenable):
                 item["text"] = chunk
                 items.append(item)
             for item in items:
-                post = await self._api("chat.postMessage", _Schema.chat_post, data=item)
+                post = await self._api("chat.postMessage", data=item)
                 receipts.append(await SlackMessage.from_post(self, post))
         return receipts
 
@@ -1208,7 +1305,7 @@ class SlackPlug(immp.Plug, immp.HTTPOpenable):
     async def _poll(self):
         while self.state == immp.OpenState.active and not self._closing:
             try:
-                json = await self._socket.receive_json()
+                json = await self._socket.receive_json(loads=json_loads)
             except CancelledError:
                 log.debug("User %r cancelling polling", self._bot_user)
                 return
@@ -1235,13 +1332,16 @@ class SlackPlug(immp.Plug, immp.HTTPOpenable):
                     log.debug("User %r ignoring unknown Events API callback %r",
                               self._bot_user, payload["type"])
                     continue
-                event = payload["event"]
+                event = _Schema.event(payload["event"])
             else:
-                event = payload = _Schema.event(json)
+                event = _Schema.event(json)
             log.debug("User %r received a %r event", self._bot_user, event["type"])
             if event["type"] in ("team_join", "user_change"):
                 # A user appeared or changed, update our cache.
-                self._users[event["user"]["id"]] = SlackUser.from_member(self, event["user"])
+                user = SlackUser.from_member(self, event["user"])
+                self._users[user.id] = user
+                if user.bot_id:
+                    self._bot_to_user[user.bot_id] = user
             elif event["type"] in ("channel_created", "channel_joined", "channel_rename",
                                    "group_created", "group_joined", "group_rename"):
                 # A group or channel appeared or updated, add to our cache.
@@ -9,6 +9,9 @@ Requirements:
     `telethon <https://telethon.readthedocs.io/en/latest/>`_:
         Required for use of app features (client updates, user lookups, message history).
 
+    `orjson <https://github.com/ijl/orjson>`_:
+        Optional, used in place of the standard library to decode API responses.
+
 Config:
     token (str):
         Telegram bot token for the bot API.
@@ -47,16 +50,24 @@ methods.  With a session file, you need only do this once, after which the refer
 "access hash") is cached.
 """
 
-from asyncio import CancelledError, TimeoutError, ensure_future, gather, sleep, wait
-from collections import defaultdict
+from asyncio import (CancelledError, Future, TimeoutError, ensure_future, gather, shield, sleep,
+                     wait)
 from datetime import datetime, timezone
+from functools import lru_cache, partial
 import logging
+from operator import itemgetter
+from time import monotonic
 
-from aiohttp import ClientError, ClientResponseError, FormData
+from aiohttp import ClientError, FormData
 
 import immp
 
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 try:
     from telethon import TelegramClient, events, tl
     from telethon.errors import BadRequestError, ChannelPrivateError
@@ -69,6 +80,11 @@ except ImportError:
 log = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=64)
+def _api_url(token, endpoint):
+    return "https://api.telegram.org/bot{}/{}".format(token, endpoint)
+
+
 class _Schema:
 
     config = immp.Schema({"token": str,
@@ -151,19 +167,33 @@ class _Schema:
     message.raw.update({immp.Optional("reply_to_message"): immp.Nullable(message),
                         immp.Optional("pinned_message"): immp.Nullable(message)})
 
+    # Messages are validated in full when parsed, so avoid doing so twice for updates.
     update = immp.Schema({"update_id": int,
                           immp.Optional(immp.Any("message", "edited_message",
-                                                 "channel_post", "edited_channel_post")): message})
+                                                 "channel_post", "edited_channel_post")): dict})
 
-    @staticmethod
-    def api(result=None):
+    # Responses are checked for errors before validation, so only successful ones are described
+    # here.  Each is built once up front, rather than for every request.
+    def _api(result=None):
         success = {"ok": True}
         if result:
             success["result"] = result
-        return immp.Schema(immp.Any(success,
-                                    {"ok": False,
-                                     "description": str,
-                                     "error_code": int}))
+        return immp.Schema(success)
+
+    api_error = immp.Schema({"ok": False, "description": str, "error_code": int,
+                             immp.Optional("parameters", dict):
+                                 {immp.Optional("retry_after"): immp.Nullable(int)}})
+
+    api_user = _api(user)
+    api_chat = _api(chat)
+    api_admins = _api(admins)
+    api_link = _api(link)
+    api_file = _api(file)
+    # Sent messages are validated in full when parsed.
+    api_message = _api(dict)
+    api_updates = _api([update])
+
+    api = _api()
 
 
 class TelegramAPIConnectError(immp.PlugError):
@@ -178,6 +208,21 @@ class TelegramAPIRequestError(immp.PlugError):
     """
 
 
+class TelegramAPITryAgain(TelegramAPIRequestError):
+    """
+    Rate-limited response from the Telegram API (error code 429).
+
+    Attributes:
+        retry_after (int):
+            Number of seconds to wait before retrying, if provided by Telegram.
+    """
+    CODE = 429
+
+    def __init__(self, *args, retry_after=None):
+        super().__init__(*args)
+        self.retry_after = retry_after
+
+
 class _HiddenSender:
 
     # @HiddenSender, "a user": author of message forwards when opted to be linked back to them.
@@ -383,6 +428,18 @@ class TelegramSegment(immp.Segment):
     Plug-friendly representation of Telegram message formatting.
     """
 
+    # Formatting attributes and their HTML tags, from innermost to outermost.
+    _tags = (("code", "<code>", "</code>"),
+             ("pre", "<pre>", "</pre>"),
+             ("bold", "<b>", "</b>"),
+             ("italic", "<i>", "</i>"),
+             ("underline", "<u>", "</u>"),
+             ("strike", "<s>", "</s>"))
+
+    @classmethod
+    def _escape(cls, text):
+        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
     @classmethod
     def to_html(cls, telegram, segment):
         """
@@ -398,7 +455,7 @@ class TelegramSegment(immp.Segment):
             str:
                 HTML-formatted string.
         """
-        text = segment.text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        text = cls._escape(segment.text)
         link = None
         if segment.mention:
             if segment.mention.plug.network_name == telegram.network_name:
@@ -406,27 +463,20 @@ class TelegramSegment(immp.Segment):
                     # Telegram will parse this automatically.
                     text = "@{}".format(segment.mention.username)
                 else:
-                    # Make a link that looks like a mention.
+                    # Make a link that looks like a mention, falling back to the ID if unnamed.
+                    name = segment.mention.real_name or str(segment.mention.id)
                     text = ("<a href=\"tg://user?id={}\">{}</a>"
-                            .format(segment.mention.id, segment.mention.real_name))
+                            .format(segment.mention.id, cls._escape(name)))
             else:
                 link = segment.mention.link
         else:
             link = segment.link
         if link:
             text = "<a href=\"{}\">{}</a>".format(link, text)
-        if segment.code:
-            text = "<code>{}</code>".format(text)
-        if segment.pre:
-            text = "<pre>{}</pre>".format(text)
-        if segment.bold:
-            text = "<b>{}</b>".format(text)
-        if segment.italic:
-            text = "<i>{}</i>".format(text)
-        if segment.underline:
-            text = "<u>{}</u>".format(text)
-        if segment.strike:
-            text = "<s>{}</s>".format(text)
+        tags = [(start, end) for attr, start, end in cls._tags if getattr(segment, attr)]
+        if tags:
+            opens = [start for start, _ in reversed(tags)]
+            text = "".join([*opens, text, *(end for _, end in tags)])
         return text
 
 
@@ -435,21 +485,37 @@ class TelegramRichText(immp.RichText):
     Wrapper for Telegram-specific parsing of formatting.
     """
 
+    # Bot API entity types that map to a boolean segment field.
+    _format_entities = {"bold": "bold",
+                        "italic": "italic",
+                        "underline": "underline",
+                        "strikethrough": "strike",
+                        "code": "code",
+                        "pre": "pre"}
+
+    # All entity types that we can represent -- others (e.g. hashtags) are left as plain text.
+    _known_entities = frozenset(_format_entities) | {"url", "email", "text_link",
+                                                     "mention", "text_mention"}
+
     @classmethod
     def _from_changes(cls, text, changes):
+        # Changes are (offset, field, value) tuples.  Sorting is stable, so changes at the same
+        # offset are applied in the order they were recorded.
+        changes = sorted(changes, key=itemgetter(0))
+        changes.append((len(text), None, None))
         segments = []
-        points = list(sorted(changes.keys()))
         formatting = {}
-        # Iterate through text in change start/end pairs.
-        for start, end in zip([0] + points, points + [len(text)]):
-            formatting.update(changes[start])
-            if start == end:
-                # Zero-length segment at the start or end, ignore it.
-                continue
-            part = text[start:end]
-            if isinstance(part, bytes):
-                part = part.decode("utf-16-le")
-            segments.append(immp.Segment(part, **formatting))
+        start = 0
+        # Walk through the changes, making a segment each time we move past some text.
+        for end, field, value in changes:
+            if end > start:
+                part = text[start:end]
+                if isinstance(part, bytes):
+                    part = part.decode("utf-16-le")
+                segments.append(immp.Segment(part, **formatting))
+                start = end
+            if field:
+                formatting[field] = value
         return cls(segments)
 
     @classmethod
@@ -476,16 +542,26 @@ class TelegramRichText(immp.RichText):
             return immp.RichText([immp.Segment(text)])
         # Telegram entities assume the text is UTF-16.
         encoded = text.encode("utf-16-le")
-        changes = defaultdict(dict)
-        for json in entities:
-            entity = _Schema.entity(json)
+        # Skip validating entities that won't be represented anyway.
+        entities = [_Schema.entity(json) for json in entities
+                    if json.get("type") in cls._known_entities]
+        # Look up all mentioned usernames together, rather than one at a time.
+        mentions = {}
+        for entity in entities:
+            if entity["type"] == "mention":
+                start = entity["offset"] * 2
+                end = start + (entity["length"] * 2)
+                mentions[encoded[start + 2:end].decode("utf-16-le")] = None
+        if mentions:
+            users = await gather(*(telegram.user_from_username(username)
+                                   for username in mentions))
+            mentions = dict(zip(mentions, users))
+        changes = []
+        for entity in entities:
             start = entity["offset"] * 2
             end = start + (entity["length"] * 2)
-            if entity["type"] in ("bold", "italic", "underline", "code", "pre"):
-                key = entity["type"]
-                value = True
-            elif entity["type"] == "strikethrough":
-                key = "strike"
+            if entity["type"] in cls._format_entities:
+                key = cls._format_entities[entity["type"]]
                 value = True
             elif entity["type"] == "url":
                 key = "link"
@@ -498,16 +574,14 @@ class TelegramRichText(immp.RichText):
                 value = entity["url"]
             elif entity["type"] == "mention":
                 key = "mention"
-                username = encoded[start + 2:end].decode("utf-16-le")
-                value = await telegram.user_from_username(username)
+                value = mentions[encoded[start + 2:end].decode("utf-16-le")]
             elif entity["type"] == "text_mention":
                 key = "mention"
                 value = TelegramUser.from_bot_user(telegram, entity["user"])
             else:
                 continue
             clear = False if value is True else None
-            changes[start][key] = value
-            changes[end][key] = clear
+            changes += ((start, key, value), (end, key, clear))
         return cls._from_changes(encoded, changes)
 
     @classmethod
@@ -531,7 +605,7 @@ class TelegramRichText(immp.RichText):
             return None
         elif not entities:
             return immp.RichText([immp.Segment(text)])
-        changes = defaultdict(dict)
+        changes = []
         for entity in entities:
             value = True
             if isinstance(entity, tl.types.MessageEntityBold):
@@ -565,8 +639,7 @@ class TelegramRichText(immp.RichText):
             else:
                 continue
             clear = False if value is True else None
-            changes[entity.offset][key] = value
-            changes[entity.offset + entity.length][key] = clear
+            changes += ((entity.offset, key, value), (entity.offset + entity.length, key, clear))
         return cls._from_changes(text, changes)
 
 
@@ -605,16 +678,11 @@ class TelegramFile(immp.File):
             .TelegramFile:
                 Parsed file object.
         """
-        try:
-            file_ = await telegram._api("getFile", _Schema.file, params={"file_id": id_})
-        except TelegramAPIRequestError:
-            # Can happen if the file is too big, in which case just return a placeholder.
-            log.warning("Failed to retrieve message attachment", exc_info=True)
+        path = await telegram._file_path(id_)
+        if not path:
             return immp.File(name, type_)
-        else:
-            url = ("https://api.telegram.org/file/bot{}/{}"
-                   .format(telegram.config["token"], file_["file_path"]))
-            return immp.File(name, type_, url)
+        url = "https://api.telegram.org/file/bot{}/{}".format(telegram.config["token"], path)
+        return immp.File(name, type_, url)
 
 
 class TelegramMessage(immp.Message):
@@ -624,22 +692,12 @@ class TelegramMessage(immp.Message):
 
     _file_types = ("animation", "video", "video_note", "audio", "voice", "document")
 
-    @classmethod
-    async def from_bot_message(cls, telegram, json):
-        """
-        Convert an API message :class:`dict` to a :class:`.Message`.
+    # Update fields that may hold a message, in order of preference.
+    _update_types = ("message", "edited_message", "channel_post", "edited_channel_post")
 
-        Args:
-            telegram (.TelegramPlug):
-                Related plug instance that provides the event.
-            json (dict):
-                Telegram API `message <https://core.telegram.org/bots/api#message>`_ object.
-
-        Returns:
-            .TelegramMessage:
-                Parsed message object.
-        """
-        message = _Schema.message(json)
+    @classmethod
+    async def _parse_bot_message(cls, telegram, message):
+        # Takes a message already validated by the schema, which covers its embedded messages too.
         # Message IDs are just a sequence, only unique to their channel and not the whole network.
         # Pair with the chat ID for a network-unique value.
         id_ = "{}:{}".format(message["chat"]["id"], message["message_id"])
@@ -647,11 +705,16 @@ class TelegramMessage(immp.Message):
         at = datetime.fromtimestamp(message["date"], timezone.utc)
         channel = immp.Channel(telegram, message["chat"]["id"])
         edited = bool(message["edit_date"])
-        text = await TelegramRichText.from_bot_entities(telegram, message["text"],
-                                                        message["entities"])
+        parse = TelegramRichText.from_bot_entities(telegram, message["text"], message["entities"])
+        if message["reply_to_message"]:
+            # Parse the replied-to message alongside this one.
+            reply = cls._parse_bot_message(telegram, message["reply_to_message"])
+            text, reply_to = await gather(parse, reply)
+        else:
+            text = await parse
+            reply_to = None
         user = None
         action = False
-        reply_to = None
         joined = None
         left = None
         title = None
@@ -661,8 +724,6 @@ class TelegramMessage(immp.Message):
         elif message["sender_chat"] and not _HiddenSender.has(message["sender_chat"]["id"]):
             user = TelegramUser.from_bot_channel(telegram, message["sender_chat"],
                                                  message["author_signature"])
-        if message["reply_to_message"]:
-            reply_to = await cls.from_bot_message(telegram, message["reply_to_message"])
         # At most one of these fields will be set.
         if message["group_chat_created"]:
             action = True
@@ -675,10 +736,11 @@ class TelegramMessage(immp.Message):
             if joined == [user]:
                 text = "joined group via invite link"
             else:
-                text = immp.RichText()
+                segments = []
                 for join in joined:
-                    text.append(immp.Segment(", " if text else "invited "),
-                                immp.Segment(join.real_name, bold=True, link=join.link))
+                    segments += (immp.Segment(", " if segments else "invited "),
+                                 immp.Segment(join.real_name, bold=True, link=join.link))
+                text = immp.RichText(segments)
         elif message["left_chat_member"]:
             left = [TelegramUser.from_bot_user(telegram, message["left_chat_member"])]
             action = True
@@ -696,7 +758,7 @@ class TelegramMessage(immp.Message):
         elif message["new_chat_photo"]:
             action = True
             text = "changed group photo"
-            photo = max(message["new_chat_photo"], key=lambda photo: photo["height"])
+            photo = max(message["new_chat_photo"], key=itemgetter("height"))
             attachments.append(await TelegramFile.from_id(telegram, photo["file_id"],
                                                           immp.File.Type.image))
         elif message["delete_chat_photo"]:
@@ -705,10 +767,10 @@ class TelegramMessage(immp.Message):
         elif message["pinned_message"]:
             action = True
             text = "pinned a message"
-            attachments.append(await cls.from_bot_message(telegram, message["pinned_message"]))
+            attachments.append(await cls._parse_bot_message(telegram, message["pinned_message"]))
         elif message["photo"]:
             # This is a list of resolutions, find the original sized one to return.
-            photo = max(message["photo"], key=lambda photo: photo["height"])
+            photo = max(message["photo"], key=itemgetter("height"))
             attachments.append(await TelegramFile.from_id(telegram, photo["file_id"],
                                                           immp.File.Type.image))
             if message["caption"]:
@@ -821,6 +883,23 @@ class TelegramMessage(immp.Message):
                                     attachments=attachments,
                                     **common)
 
+    @classmethod
+    async def from_bot_message(cls, telegram, json):
+        """
+        Convert an API message :class:`dict` to a :class:`.Message`.
+
+        Args:
+            telegram (.TelegramPlug):
+                Related plug instance that provides the event.
+            json (dict):
+                Telegram API `message <https://core.telegram.org/bots/api#message>`_ object.
+
+        Returns:
+            .TelegramMessage:
+                Parsed message object.
+        """
+        return await cls._parse_bot_message(telegram, _Schema.message(json))
+
     @classmethod
     async def from_bot_update(cls, telegram, update):
         """
@@ -834,13 +913,12 @@ class TelegramMessage(immp.Message):
 
         Returns:
             .TelegramMessage:
-                Parsed message object.
+                Parsed message object, or ``None`` if the update doesn't contain a message.
         """
-        for key in ("message", "channel_post"):
+        for key in cls._update_types:
             if update.get(key):
                 return await cls.from_bot_message(telegram, update[key])
-            elif update.get("edited_{}".format(key)):
-                return await cls.from_bot_message(telegram, update["edited_{}".format(key)])
+        return None
 
     @classmethod
     async def from_proto_message(cls, telegram, message):
@@ -928,10 +1006,11 @@ class TelegramMessage(immp.Message):
                 if joined == [user]:
                     text = "joined group"
                 else:
-                    text = immp.RichText()
+                    segments = []
                     for join in joined:
-                        text.append(immp.Segment(", " if text else "invited "),
-                                    immp.Segment(join.real_name, link=join.link))
+                        segments += (immp.Segment(", " if segments else "invited "),
+                                     immp.Segment(join.real_name, link=join.link))
+                    text = immp.RichText(segments)
             elif isinstance(message.action, tl.types.MessageActionChatDeleteUser):
                 left = [await telegram.user_from_id(message.action.user_id)]
                 if left == [user]:
@@ -1051,6 +1130,19 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
 
     network_name = "Telegram"
 
+    # Maximum number of entries to hold in each of the lookup caches.
+    _cache_limit = 4096
+    # Download paths are guaranteed by Telegram to remain valid for at least an hour.
+    _file_ttl = 3600
+
+    # All API calls go to the same host, so hold its DNS entry for longer than the default 10s.
+    _connector_options = {"ttl_dns_cache": 300}
+
+    # Upper bound in seconds on the delay between failed attempts to fetch updates.
+    _backoff_limit = 30
+    # Error codes that won't resolve by retrying, e.g. a revoked bot token.
+    _fatal_codes = (401, 403, 404)
+
     @property
     def network_id(self):
         return "telegram:{}".format(self._bot_user["id"]) if self._bot_user else None
@@ -1068,9 +1160,12 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         self._closing = False
         # Temporary tracking of migrated chats for the current session.
         self._migrations = {}
-        # Caching of user/username lookups to avoid flooding.
+        # Caching of user/username lookups to avoid flooding, holding either a resolved user or a
+        # pending lookup task.
         self._users = {}
         self._usernames = {}
+        # Likewise for file download paths, which are repeated by replies, pins and forwards.
+        self._files = {}
         # Blacklist of channels we have an entity for but can't access.  Indexed at startup, with
         # chats removed if we receive a message from that channel.
         self._blacklist = set()
@@ -1081,31 +1176,35 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         # highest we've seen, so that we can attempt to fetch past messages with this as a base.
         self._last_id = None
 
-    async def _api(self, endpoint, type_=None, quiet=False, **kwargs):
-        url = "https://api.telegram.org/bot{}/{}".format(self.config["token"], endpoint)
+    async def _api(self, endpoint, schema=_Schema.api, quiet=False, **kwargs):
+        url = _api_url(self.config["token"], endpoint)
         if not quiet:
             log.debug("Making API request to %r", endpoint)
         try:
             async with self.session.post(url, **kwargs) as resp:
                 try:
-                    json = await resp.json()
-                    schema = _Schema.api(type_)
-                    data = schema(json)
-                except ClientResponseError as e:
+                    # Responses are always UTF-8 JSON, so decode the raw body directly rather than
+                    # having aiohttp detect the encoding and build an intermediate string.
+                    json = json_loads(await resp.read())
+                except ValueError as e:
                     raise TelegramAPIConnectError("Bad response with code: {}"
                                                   .format(resp.status)) from e
         except ClientError as e:
             raise TelegramAPIConnectError("Request failed") from e
         except TimeoutError as e:
             raise TelegramAPIConnectError("Request timed out") from e
-        if not data["ok"]:
-            raise TelegramAPIRequestError(data["error_code"], data["description"])
-        return data["result"]
+        if not isinstance(json, dict) or not json.get("ok"):
+            error = _Schema.api_error(json)
+            if error["error_code"] == TelegramAPITryAgain.CODE:
+                raise TelegramAPITryAgain(error["error_code"], error["description"],
+                                          retry_after=error["parameters"]["retry_after"])
+            raise TelegramAPIRequestError(error["error_code"], error["description"])
+        return schema(json)["result"]
 
     async def start(self):
         await super().start()
         self._closing = False
-        self._bot_user = await self._api("getMe", _Schema.user)
+        self._bot_user = await self._api("getMe", _Schema.api_user)
         if self.config["api-id"] and self.config["api-hash"]:
             if not TelegramClient:
                 raise immp.ConfigError("API ID/hash specified but Telethon is not installed")
@@ -1159,6 +1258,68 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         if self._migrations:
             log.warning("Chat migrations require a config update before next run")
 
+    async def _cached_lookup(self, cache, key, fetch, ttl=None):
+        # Lookups may be requested many times in parallel (e.g. for each message in a batch), so
+        # share a single request between concurrent callers for the same key.  Entries are either
+        # a pending lookup task, or a (result, expiry) pair once resolved.
+        cached = cache.get(key)
+        if isinstance(cached, Future):
+            return await shield(cached)
+        elif cached:
+            result, expiry = cached
+            if expiry is None or expiry > monotonic():
+                return result
+            del cache[key]
+        if len(cache) >= self._cache_limit:
+            # Evict the oldest entry to keep the cache bounded.
+            del cache[next(iter(cache))]
+        task = cache[key] = ensure_future(fetch(key))
+        # Settle the cache entry when the lookup finishes, even if all of its callers are cancelled.
+        task.add_done_callback(partial(self._cached_done, cache, key, ttl))
+        return await shield(task)
+
+    @staticmethod
+    def _cached_done(cache, key, ttl, task):
+        if cache.get(key) is not task:
+            # Evicted whilst the lookup was still in progress.
+            return
+        elif task.cancelled() or task.exception() or not task.result():
+            # Don't cache failed lookups.
+            del cache[key]
+        else:
+            cache[key] = (task.result(), None if ttl is None else monotonic() + ttl)
+
+    async def _fetch_user(self, id_):
+        try:
+            data = await self._client(tl.functions.users.GetFullUserRequest(id_))
+        except ValueError:
+            log.warning("Missing entity for user %d", id_)
+            return None
+        except BadRequestError:
+            return None
+        return TelegramUser.from_proto_user(self, data.user)
+
+    async def _fetch_username(self, username):
+        try:
+            data = await self._client(tl.functions.contacts.ResolveUsernameRequest(username))
+        except BadRequestError:
+            return None
+        if not data.users:
+            return None
+        return TelegramUser.from_proto_user(self, data.users[0])
+
+    async def _fetch_file(self, id_):
+        try:
+            file_ = await self._api("getFile", _Schema.api_file, params={"file_id": id_})
+        except TelegramAPIRequestError:
+            # Can happen if the file is too big, in which case just return a placeholder.
+            log.warning("Failed to retrieve message attachment", exc_info=True)
+            return None
+        return file_["file_path"]
+
+    async def _file_path(self, id_):
+        return await self._cached_lookup(self._files, id_, self._fetch_file, self._file_ttl)
+
     async def user_from_id(self, id_):
         id_ = int(id_)
         if not self._client:
@@ -1167,18 +1328,7 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         entity = self._client.session.get_entity(id_)
         if entity:
             return TelegramUser.from_entity(self, entity)
-        elif id_ in self._users:
-            return self._users[id_]
-        try:
-            data = await self._client(tl.functions.users.GetFullUserRequest(id_))
-        except ValueError:
-            log.warning("Missing entity for user %d", id_)
-            return None
-        except BadRequestError:
-            return None
-        user = TelegramUser.from_proto_user(self, data.user)
-        self._users[id_] = user
-        return user
+        return await self._cached_lookup(self._users, id_, self._fetch_user)
 
     async def user_from_username(self, username):
         if not self._client:
@@ -1187,17 +1337,7 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         entity = self._client.session.get_entity_username(username)
         if entity:
             return TelegramUser.from_entity(self, entity)
-        elif username in self._usernames:
-            return self._usernames[username]
-        try:
-            data = await self._client(tl.functions.contacts.ResolveUsernameRequest(username))
-        except BadRequestError:
-            return None
-        if not data.users:
-            return None
-        user = TelegramUser.from_proto_user(self, data.users[0])
-        self._usernames[username] = user
-        return user
+        return await self._cached_lookup(self._usernames, username, self._fetch_username)
 
     async def user_is_system(self, user):
         return user.id == str(self._bot_user["id"])
@@ -1209,7 +1349,8 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         count = 0
         for user in self._client.session.get_user_entities():
             try:
-                await self._api("getChat", _Schema.chat, quiet=True, params={"chat_id": user[0]})
+                await self._api("getChat", _Schema.api_chat, quiet=True,
+                                params={"chat_id": user[0]})
             except TelegramAPIRequestError:
                 count += 1
                 self._blacklist.add(user[0])
@@ -1262,7 +1403,7 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         if not isinstance(user, TelegramUser):
             return None
         try:
-            await self._api("getChat", _Schema.chat, params={"chat_id": user.id})
+            await self._api("getChat", _Schema.api_chat, params={"chat_id": user.id})
         except TelegramAPIRequestError as e:
             log.warning("Failed to retrieve user %s channel", user.id, exc_info=e)
             # Can't create private channels, users must initiate conversations with bots.
@@ -1281,7 +1422,7 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
             if entity:
                 return entity[2]
         try:
-            data = await self._api("getChat", _Schema.chat, params={"chat_id": channel.source})
+            data = await self._api("getChat", _Schema.api_chat, params={"chat_id": channel.source})
         except TelegramAPIRequestError as e:
             log.warning("Failed to retrieve channel %s title", channel.source, exc_info=e)
             return None
@@ -1342,7 +1483,7 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         if not self._client:
             log.debug("Client auth required to list channel admins")
             return None
-        admins = await self._api("getChatAdministrators", _Schema.admins,
+        admins = await self._api("getChatAdministrators", _Schema.api_admins,
                                  params={"chat_id": channel.source})
         return [TelegramUser.from_bot_user(self, admin["user"]) for admin in admins]
 
@@ -1358,15 +1499,15 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         if not shared:
             # Create a new single-use invite link.
             params["member_limit"] = 1
-            meta = await self._api("createChatInviteLink", _Schema.link, params=params)
+            meta = await self._api("createChatInviteLink", _Schema.api_link, params=params)
             link = meta["invite_link"]
             log.debug("Created invite link for %r: %r", channel.source, link)
             return link
-        chat = await self._api("getChat", _Schema.chat, params=params)
+        chat = await self._api("getChat", _Schema.api_chat, params=params)
         # Reuse a primary invite link if available, otherwise create a new one.
         if chat["invite_link"]:
             return chat["invite_link"]
-        link = await self._api("exportChatInviteLink", _Schema.link, params=params)
+        link = await self._api("exportChatInviteLink", _Schema.api_link, params=params)
         log.debug("Regenerated invite link for %r: %r", channel.source, link)
         return link
 
@@ -1453,7 +1594,7 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
     async def _upload_attachment(self, chat, msg, attach, reply_to=None, caption=None):
         # Upload a file to Telegram in its own message.
         # Prefer a source URL if available, else fall back to re-uploading the file.
-        base = {"chat_id": str(chat)}
+        base = {"chat_id": chat}
         if reply_to:
             base.update({"reply_to_message_id": reply_to,
                          "allow_sending_without_reply": "true"})
@@ -1467,24 +1608,24 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
                     what = "a file"
                 caption = immp.Message(text=immp.RichText([immp.Segment("sent {}".format(what))]),
                                        user=msg.user, action=True).render()
-            text = "".join(TelegramSegment.to_html(self, segment) for segment in caption)
+            text = "".join([TelegramSegment.to_html(self, segment) for segment in caption])
             base["caption"] = text
             base["parse_mode"] = "HTML"
         if attach.type == immp.File.Type.image:
             data = await self._form_data(base, "photo", attach)
             try:
-                return await self._api("sendPhoto", _Schema.message, data=data)
+                return await self._api("sendPhoto", _Schema.api_message, data=data)
             except (TelegramAPIConnectError, TelegramAPIRequestError):
                 log.debug("Failed to upload image, falling back to document upload")
         elif attach.type == immp.File.Type.video:
             data = await self._form_data(base, "video", attach)
             try:
-                return await self._api("sendVideo", _Schema.message, data=data)
+                return await self._api("sendVideo", _Schema.api_message, data=data)
             except (TelegramAPIConnectError, TelegramAPIRequestError):
                 log.debug("Failed to upload video, falling back to document upload")
         data = await self._form_data(base, "document", attach)
         try:
-            return await self._api("sendDocument", _Schema.message, data=data)
+            return await self._api("sendDocument", _Schema.api_message, data=data)
         except TelegramAPIConnectError as e:
             log.warning("Failed to upload file", exc_info=e)
             return None
@@ -1518,10 +1659,10 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
             requests.append(self._upload_attachment(chat, msg, primary, reply_to, rich))
         elif rich:
             for chunk in rich.chunked(4096):
-                text = "".join(TelegramSegment.to_html(self, segment) for segment in chunk)
+                text = "".join([TelegramSegment.to_html(self, segment) for segment in chunk])
                 # Prevent linked user names generating link previews.
                 no_link_preview = "true" if msg.user and msg.user.link else "false"
-                requests.append(self._api("sendMessage", _Schema.message,
+                requests.append(self._api("sendMessage", _Schema.api_message,
                                           params={"chat_id": chat,
                                                   "text": text,
                                                   "parse_mode": "HTML",
@@ -1535,15 +1676,15 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
             elif isinstance(attach, immp.File):
                 requests.append(self._upload_attachment(chat, msg, attach))
             elif isinstance(attach, immp.Location):
-                requests.append(self._api("sendLocation", _Schema.message,
+                requests.append(self._api("sendLocation", _Schema.api_message,
                                           params={"chat_id": chat,
                                                   "latitude": str(attach.latitude),
                                                   "longitude": str(attach.longitude)}))
                 if msg.user:
                     caption = immp.Message(user=msg.user, text="sent a location", action=True)
-                    text = "".join(TelegramSegment.to_html(self, segment)
-                                   for segment in caption.render())
-                    requests.append(self._api("sendMessage", _Schema.message,
+                    text = "".join([TelegramSegment.to_html(self, segment)
+                                    for segment in caption.render()])
+                    requests.append(self._api("sendMessage", _Schema.api_message,
                                               params={"chat_id": chat,
                                                       "text": text,
                                                       "parse_mode": "HTML"}))
@@ -1554,13 +1695,15 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
         while chat in self._migrations:
             log.debug("Following chat migration: %r -> %r", chat, self._migrations[chat])
             chat = self._migrations[chat]
+        # Form and query fields are sent as strings, so convert the chat ID once for all requests.
+        chat = str(chat)
         requests = []
         for attach in msg.attachments:
             # Generate requests for attached messages first.
             if isinstance(attach, immp.Receipt):
                 # Forward the messages natively using the given chat/ID.
                 forward_chat, forward_id = map(int, attach.id.split(":", 1))
-                requests.append(self._api("forwardMessage", _Schema.message,
+                requests.append(self._api("forwardMessage", _Schema.api_message,
                                           params={"chat_id": chat,
                                                   "from_chat_id": forward_chat,
                                                   "message_id": forward_id}))
@@ -1603,42 +1746,54 @@ class TelegramPlug(immp.Plug, immp.HTTPOpenable):
             self._last_id = seq
 
     async def _poll(self):
+        retry = 0
         while not self._closing:
             params = {"offset": self._offset,
                       "timeout": 240}
-            fetch = ensure_future(self._api("getUpdates", [_Schema.update], params=params))
+            fetch = ensure_future(self._api("getUpdates", _Schema.api_updates, params=params))
             try:
                 result = await fetch
             except CancelledError:
                 log.debug("Cancelling polling")
                 return
+            except TelegramAPITryAgain as e:
+                # Honour Telegram's requested delay, without counting towards the backoff.
+                delay = e.retry_after or 3
+                log.debug("Rate limited, retrying in %d seconds", delay)
+                await sleep(delay)
+                continue
             except (TelegramAPIConnectError, TelegramAPIRequestError) as e:
+                if isinstance(e, TelegramAPIRequestError) and e.args[0] in self._fatal_codes:
+                    log.error("Unrecoverable error from API: %r", e)
+                    raise
+                delay = min(self._backoff_limit, 2 ** retry)
+                retry += 1
                 log.debug("Unexpected response or timeout: %r", e)
-                log.debug("Reconnecting in 3 seconds")
-                await sleep(3)
+                log.debug("Reconnecting in %d seconds", delay)
+                await sleep(delay)
                 continue
             except Exception as e:
                 log.exception("Uncaught exception during long-poll: %r", e)
                 raise
+            retry = 0
             for update in result:
                 log.debug("Received an update")
-                if "message" in update and update["message"]["migrate_to_chat_id"]:
+                if "message" in update and update["message"].get("migrate_to_chat_id"):
                     old = update["message"]["chat"]["id"]
                     new = update["message"]["migrate_to_chat_id"]
                     self._migrate(old, new)
-                if any(key in update or "edited_{}".format(key) in update
-                       for key in ("message", "channel_post")):
-                    try:
-                        sent = await TelegramMessage.from_bot_update(self, update)
-                    except NotImplementedError:
-                        log.debug("Skipping message with no usable parts")
-                    except CancelledError:
-                        log.debug("Cancel request for plug %r getter", self.name)
-                        return
-                    else:
-                        self._post_recv(sent)
+                try:
+                    sent = await TelegramMessage.from_bot_update(self, update)
+                except NotImplementedError:
+                    log.debug("Skipping message with no usable parts")
+                except CancelledError:
+                    log.debug("Cancel request for plug %r getter", self.name)
+                    return
                 else:
-                    log.debug("Ignoring update with unknown keys: %s", ", ".join(update.keys()))
+                    if sent:
+                        self._post_recv(sent)
+                    else:
+                        log.debug("Ignoring update with unknown keys: %s", ", ".join(update))
                 self._offset = max(update["update_id"] + 1, self._offset)
 
     async def _handle_raw(self, event):